@@ -2,46 +2,224 @@
 # -*- coding: utf-8 -*-
 
 import os
+import gzip
 import json
 import re
-import PyPDF2
+try:
+    import pymupdf
+except ImportError:  # PyMuPDF 1.24.3 之前只提供 fitz 模組名稱
+    import fitz as pymupdf
 from datetime import datetime
+from functools import lru_cache, partial
 import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import orjson
+except ImportError:  # 未安裝 orjson 時退回標準函式庫
+    orjson = None
+
+try:
+    import re2 as re_fast  # google-re2，以DFA比對，不會回溯
+except ImportError:  # 未安裝 re2 時退回標準函式庫
+    re_fast = re
+
+# 預先編譯的正則表達式，避免在逐行解析時重複查詢 re 模組的快取
+_RE_FILENAME_DATE = re.compile(r'(\d+)年(\d+)月(\d+)日')
+# 逐行分類用的樣式交給 re2 編譯；中文字元範圍以實際字元表示，re 與 re2 皆可解析
+if re_fast is re:
+    _RECORD_PREFIX = r'^(\d+)\s+'
+else:
+    # re2 的 \d、\s 只比對ASCII，改用 \p{Nd} 及完整的Unicode空白字元，與 re 的比對範圍相同
+    _RECORD_PREFIX = (
+        '^(\\p{Nd}+)'
+        '[\t\n\x0b\x0c\r\x1c-\x1f \x85\xa0\u1680\u2000-\u200a\u2028\u2029\u202f\u205f\u3000]+'
+    )
+# 姓名為連續2個以上的中文字(含複姓，如「張簡志明」)，遇空白、數字或其他符號即停止；
+# 字元範圍包含相容表意字與擴充區，避免罕用字(如「育」U+2F982)造成姓名截斷
+_RE_NEW_RECORD = re_fast.compile(
+    _RECORD_PREFIX + '([\u4e00-\u9fff\uf900-\ufaff\U00020000-\U0002fa1f]{2,})'
+)
+_RE_DATE = re.compile(r'(\d+)/(\d+)/(\d+)')
+_RE_CLAUSE = re.compile(r'第(\d+)條第(\d+)項')
+# 記錄首行的欄位合併為單一交替樣式，以 finditer 一次掃描完成
+_RE_RECORD_FIELDS = re.compile(
+    r'(?P<date>\d+/\d+/\d+)'
+    r'|(?P<clause>第\d+條第\d+項)'
+    r'|(?P<fact>汽機車駕駛人駕駛汽機車，於十年內)'
+    r'|(?P<nextkw>汽機車駕駛人)'
+)
+
+def extract_page_text(page):
+    """
+    以PyMuPDF的文字詞組重建與表格列一致的行
+    
+    get_text("text") 會把每個表格儲存格各放一行，解析器需要的是一列一行
+    （如「1 王小明 111/7/11 第35條第3項 …」）。這裡依內容串流順序走訪詞組，
+    以詞組的垂直中心判斷換行：同高度以空格相接，往上移(同一列中較高的儲存格)
+    直接相接，往下移超過詞高的1/4才換行，與原本PyPDF2的輸出版面相同。
+    
+    Args:
+        page: PyMuPDF的頁面物件
+        
+    Returns:
+        str: 該頁的文字內容
+    """
+    parts = []
+    prev_center = None
+    for x0, y0, x1, y1, word, *_ in page.get_text("words", sort=False):
+        center = (y0 + y1) / 2
+        if prev_center is not None:
+            tolerance = (y1 - y0) / 4
+            if center - prev_center > tolerance:
+                parts.append("\n")
+            elif abs(center - prev_center) <= tolerance:
+                parts.append(" ")
+        parts.append(word)
+        prev_center = center
+    return "".join(parts)
+
+def _json_bytes(data, indent=False):
+    """
+    將資料序列化為UTF-8編碼的JSON
+    
+    Args:
+        data: 要序列化的資料
+        indent: 是否以縮排2格輸出
+        
+    Returns:
+        bytes: JSON內容
+    """
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(data, option=option)
+    return json.dumps(data, ensure_ascii=False, indent=2 if indent else None).encode('utf-8')
+
+def _dump_json(data, output_path):
+    """
+    將資料以UTF-8、縮排2格的JSON格式寫入檔案
+    
+    Args:
+        data: 要輸出的資料
+        output_path: 輸出檔案路徑
+    """
+    with open(output_path, 'wb') as f:
+        f.write(_json_bytes(data, indent=True))
+
+def _dump_result_json(result, output_path):
+    """
+    將單一PDF的結果寫入JSON檔案，records 逐筆序列化並寫出，每筆一行
+    
+    Args:
+        result: 單一PDF的結果字典
+        output_path: 輸出檔案路徑
+    """
+    with open(output_path, 'wb') as f:
+        f.write(b'{\n')
+        for key, value in result.items():
+            if key != "records":
+                f.write(b'  ' + _json_bytes(key) + b': ' + _json_bytes(value) + b',\n')
+        f.write(b'  "records": [')
+        for i, record in enumerate(result.get("records", [])):
+            f.write(b',\n    ' if i else b'\n    ')
+            f.write(_json_bytes(record))
+        f.write(b'\n  ]\n}\n')
+
+@lru_cache(maxsize=4096)
+def _parse_filename_date(filename):
+    """
+    從檔名提取公布日期
+    
+    Args:
+        filename: PDF檔名
+        
+    Returns:
+        tuple: (年, 月, 日)，找不到日期時為 None
+    """
+    date_match = _RE_FILENAME_DATE.search(filename)
+    return date_match.groups() if date_match else None
+
+def _finish_record(record):
+    """
+    將續行累積的違規事實片段合併為單一字串
+    
+    Args:
+        record: 解析中的記錄字典，將直接修改
+        
+    Returns:
+        dict: 完成的記錄
+    """
+    fact_parts = record.pop("_fact_parts", None)
+    if fact_parts is not None:
+        record["違規事實"] = " ".join(fact_parts)
+    return record
 
 class DuiPdfExtractor:
     """酒駕資料PDF解析器"""
     
-    def __init__(self, pdf_dir, output_dir):
+    def __init__(self, pdf_dir, output_dir, max_workers=None, include_raw_text=False):
         """
         初始化PDF解析器
         
         Args:
             pdf_dir: PDF檔案所在目錄
             output_dir: 輸出目錄
+            max_workers: 平行處理的行程數，None 表示使用CPU核心數
+            include_raw_text: 是否另外以 .txt.gz 保存PDF原始文字內容
         """
         self.pdf_dir = pdf_dir
         self.output_dir = output_dir
+        self.max_workers = max_workers
+        self.include_raw_text = include_raw_text
         os.makedirs(output_dir, exist_ok=True)
     
     def find_all_pdfs(self):
         """查找所有PDF檔案"""
         all_pdfs = []
         
-        # 遍歷目錄找到所有PDF檔案
-        for root, dirs, files in os.walk(self.pdf_dir):
-            for file in files:
-                if file.lower().endswith('.pdf'):
-                    all_pdfs.append(os.path.join(root, file))
+        # 以 os.scandir 遍歷目錄找到所有PDF檔案，直接使用 DirEntry 的快取型別資訊
+        # 走訪順序、符號連結與錯誤處理皆與 os.walk(topdown=True) 相同
+        pending_dirs = [self.pdf_dir]
+        while pending_dirs:
+            dir_pdfs = []
+            subdirs = []
+            try:
+                with os.scandir(pending_dirs.pop()) as entries:
+                    for entry in entries:
+                        try:
+                            is_dir = entry.is_dir()
+                        except OSError:
+                            is_dir = False
+                        
+                        if is_dir:
+                            # 不進入指向目錄的符號連結
+                            try:
+                                if not entry.is_symlink():
+                                    subdirs.append(entry.path)
+                            except OSError:
+                                pass
+                        elif entry.name.lower().endswith('.pdf'):
+                            dir_pdfs.append(entry.path)
+            except OSError:
+                # 與 os.walk 相同，略過不存在或無法讀取的目錄
+                continue
+            
+            all_pdfs.extend(dir_pdfs)
+            # 反向推入堆疊，使子目錄依原本順序先深後廣地處理
+            pending_dirs.extend(reversed(subdirs))
         
         print(f"找到 {len(all_pdfs)} 個PDF檔案")
         return all_pdfs
     
-    def extract_single_pdf(self, pdf_path):
+    def extract_single_pdf(self, pdf_path, extraction_date=None):
         """
         提取單一PDF檔案的資料
         
         Args:
             pdf_path: PDF檔案路徑
+            extraction_date: 提取時間(ISO格式)，None 表示使用目前時間
             
         Returns:
             dict: 包含提取資料的字典
@@ -52,32 +230,27 @@ class DuiPdfExtractor:
         result = {
             "filename": filename,
             "source_path": pdf_path,
-            "extraction_date": datetime.now().isoformat(),
+            "extraction_date": extraction_date or datetime.now().isoformat(),
             "records": [],
             "metadata": {}
         }
         
         # 從檔名提取日期
-        date_match = re.search(r'(\d+)年(\d+)月(\d+)日', filename)
-        if date_match:
-            year, month, day = date_match.groups()
+        filename_date = _parse_filename_date(filename)
+        if filename_date:
+            year, month, day = filename_date
             result["metadata"]["publish_date"] = f"{year}-{month}-{day}"
             result["metadata"]["year"] = year
             result["metadata"]["month"] = month
             result["metadata"]["day"] = day
         
         try:
-            with open(pdf_path, 'rb') as pdf_file:
-                pdf_reader = PyPDF2.PdfReader(pdf_file)
-                num_pages = len(pdf_reader.pages)
+            with pymupdf.open(pdf_path) as doc:
+                num_pages = doc.page_count
                 result["metadata"]["page_count"] = num_pages
                 
                 # 提取所有頁面的文字
-                full_text = ""
-                for page_num in range(num_pages):
-                    page = pdf_reader.pages[page_num]
-                    page_text = page.extract_text()
-                    full_text += page_text + "\n\n"
+                full_text = "\n\n".join(extract_page_text(page) for page in doc)
                 
                 # 儲存原始文字內容
                 result["raw_text"] = full_text
@@ -100,17 +273,19 @@ class DuiPdfExtractor:
             result: 結果字典，將直接修改
         """
         # 分割為行
-        lines = text.split('\n')
+        lines = text.splitlines()
+        line_iter = iter(lines)
         
         # 尋找表頭 - 臺中市酒駕累犯檔案使用「序號 姓名 違規日 違規條款 違規地點 違規事實」格式
-        header_index = -1
-        for i, line in enumerate(lines):
-            if "序號" in line and "姓名" in line and "違規" in line:
-                header_index = i
-                result["metadata"]["header"] = line
-                break
-        
-        if header_index == -1:
+        # 先對整份文字做一次檢查，缺少任一關鍵字時不必逐行尋找
+        header = None
+        if "序號" in text and "姓名" in text and "違規" in text:
+            for line in line_iter:
+                if "序號" in line and "姓名" in line and "違規" in line:
+                    header = line
+                    break
+        
+        if header is None:
             print(f"警告: 無法找到表頭，嘗試使用序號+姓名模式識別")
             # 第二種方式: 尋找數字序號加姓名的模式
             records = self.parse_without_header(lines)
@@ -118,65 +293,63 @@ class DuiPdfExtractor:
             result["metadata"]["record_count"] = len(records)
             return
         
-        # 解析表格資料
+        result["metadata"]["header"] = header
+        
+        # 解析表格資料 - 從表頭之後繼續同一個迭代器，不另外切片複製
         current_record = {}
         records = []
         
-        for line in lines[header_index+1:]:
+        # 迴圈內常用的方法先綁定為區域變數，省去每行的全域與屬性查找
+        match_new_record = _RE_NEW_RECORD.match
+        iter_record_fields = _RE_RECORD_FIELDS.finditer
+        
+        for raw_line in line_iter:
             # 跳過空行和頁碼
-            if not line.strip() or re.match(r'^\d+$', line.strip()):
+            line = raw_line.strip()
+            if not line or line.isdecimal():
                 continue
                 
-            # 檢測是否為新記錄 - 通常以序號(數字)開始
-            if re.match(r'^\d+\s+[\u4e00-\u9fff]{2,3}', line):
+            # 檢測是否為新記錄 - 通常以序號(數字)開始，先以首字元過濾掉大部分續行
+            record_start_match = match_new_record(line) if line[:1].isdecimal() else None
+            if record_start_match:
                 if current_record:  # 儲存前一筆記錄
-                    records.append(current_record)
-                
-                # 新記錄初始化
-                current_record = {"raw_line": line}
+                    records.append(_finish_record(current_record))
                 
-                # 提取各欄位資料
-                fields = line.split()
-                if len(fields) >= 2:
-                    current_record["序號"] = fields[0]
-                    current_record["姓名"] = fields[1]
-                
-                # 提取違規日期 - 格式如 111/7/11
-                date_match = re.search(r'(\d+)/(\d+)/(\d+)', line)
-                if date_match:
-                    year, month, day = date_match.groups()
-                    current_record["違規日"] = f"{year}/{month}/{day}"
-                
-                # 提取違規條款 - 通常為「第X條第Y項」格式
-                clause_match = re.search(r'第(\d+)條第(\d+)項', line)
-                if clause_match:
-                    article, paragraph = clause_match.groups()
-                    current_record["違規條款"] = f"第{article}條第{paragraph}項"
-                
-                # 提取違規地點 - 通常在違規條款之後
-                if clause_match:
-                    location_start = clause_match.end()
-                    next_keyword = re.search(r'汽機車駕駛人', line[location_start:])
-                    if next_keyword:
-                        location = line[location_start:location_start + next_keyword.start()].strip()
-                        current_record["違規地點"] = location
+                # 新記錄初始化，序號與姓名直接取自比對結果
+                seq_num, name = record_start_match.groups()
+                current_record = {"raw_line": line, "序號": seq_num, "姓名": name}
                 
-                # 提取違規事實
-                fact_match = re.search(r'汽機車駕駛人駕駛汽機車，於十年內(.*)$', line)
-                if fact_match:
-                    current_record["違規事實"] = "汽機車駕駛人駕駛汽機車，於十年內" + fact_match.group(1)
+                # 單次掃描提取違規日、違規條款、違規地點與違規事實
+                location_start = None
+                for match in iter_record_fields(line):
+                    kind = match.lastgroup
+                    if kind == "date":
+                        # 違規日期 - 格式如 111/7/11
+                        current_record.setdefault("違規日", match.group(0))
+                    elif kind == "clause":
+                        # 違規條款 - 通常為「第X條第Y項」格式
+                        if "違規條款" not in current_record:
+                            current_record["違規條款"] = match.group(0)
+                            location_start = match.end()
+                    else:
+                        # 違規地點 - 位於違規條款與「汽機車駕駛人」之間
+                        if location_start is not None and "違規地點" not in current_record:
+                            current_record["違規地點"] = line[location_start:match.start()].strip()
+                        # 違規事實 - 從關鍵字起至行尾；繼續掃描以免漏掉其後的日期或條款
+                        if kind == "fact" and "_fact_parts" not in current_record:
+                            current_record["_fact_parts"] = [line[match.start():]]
             elif current_record:
                 # 如果這行是上一記錄的續行
-                # 優先添加到違規事實欄位
-                if "違規事實" in current_record:
-                    current_record["違規事實"] += " " + line.strip()
+                # 優先添加到違規事實欄位，片段於記錄結束時才合併
+                if "_fact_parts" in current_record:
+                    current_record["_fact_parts"].append(line)
                 else:
                     # 否則作為附加資訊
                     current_record.setdefault("additional_info", []).append(line)
         
         # 添加最後一筆記錄
         if current_record:
-            records.append(current_record)
+            records.append(_finish_record(current_record))
         
         result["records"] = records
         result["metadata"]["record_count"] = len(records)
@@ -194,16 +367,17 @@ class DuiPdfExtractor:
         records = []
         current_record = None
         
-        for line in lines:
+        for raw_line in lines:
             # 跳過空行和頁碼
-            if not line.strip() or re.match(r'^\d+$', line.strip()):
+            line = raw_line.strip()
+            if not line or line.isdecimal():
                 continue
                 
             # 識別新記錄的模式: 數字序號 + 姓名(2-3個中文字)
-            record_start_match = re.match(r'^(\d+)\s+([\u4e00-\u9fff]{2,3})', line)
+            record_start_match = _RE_NEW_RECORD.match(line) if line[:1].isdecimal() else None
             if record_start_match:
                 if current_record:
-                    records.append(current_record)
+                    records.append(_finish_record(current_record))
                 
                 seq_num, name = record_start_match.groups()
                 current_record = {
@@ -213,12 +387,12 @@ class DuiPdfExtractor:
                 }
                 
                 # 提取違規日期
-                date_match = re.search(r'(\d+)/(\d+)/(\d+)', line)
+                date_match = _RE_DATE.search(line)
                 if date_match:
                     current_record["違規日"] = date_match.group(0)
                 
                 # 提取違規條款
-                clause_match = re.search(r'第(\d+)條第(\d+)項', line)
+                clause_match = _RE_CLAUSE.search(line)
                 if clause_match:
                     current_record["違規條款"] = clause_match.group(0)
                 
@@ -230,65 +404,92 @@ class DuiPdfExtractor:
                 elif "吸食毒品" in line or "毒品" in line:
                     current_record["違規類型"] = "毒駕"
             elif current_record:
-                # 將其它行添加為違規事實的延伸或附加資訊
-                if "違規事實" in current_record:
-                    current_record["違規事實"] += " " + line.strip()
-                else:
-                    current_record["違規事實"] = line.strip()
+                # 將其它行添加為違規事實的延伸或附加資訊，片段於記錄結束時才合併
+                current_record.setdefault("_fact_parts", []).append(line)
         
         # 添加最後一筆記錄
         if current_record:
-            records.append(current_record)
+            records.append(_finish_record(current_record))
             
         return records
     
+    def extract_and_dump(self, pdf_path, extraction_date=None):
+        """
+        提取單一PDF檔案並輸出JSON結果（供平行處理的工作行程使用）
+        
+        Args:
+            pdf_path: PDF檔案路徑
+            extraction_date: 提取時間(ISO格式)，None 表示使用目前時間
+            
+        Returns:
+            dict: 該PDF的摘要資訊
+        """
+        result = self.extract_single_pdf(pdf_path, extraction_date)
+        
+        # 生成單一PDF的輸出檔案名
+        output_basename = os.path.splitext(os.path.basename(pdf_path))[0]
+        output_path = os.path.join(self.output_dir, f"{output_basename}.json")
+        
+        # 原始文字不寫入JSON；需要時另存為壓縮檔，JSON 只記錄其路徑
+        raw_text = result.pop("raw_text", None)
+        if self.include_raw_text and raw_text is not None:
+            raw_text_path = os.path.join(self.output_dir, f"{output_basename}.txt.gz")
+            with gzip.open(raw_text_path, 'wb', compresslevel=6) as f:
+                f.write(raw_text.encode('utf-8'))
+            result["raw_text_path"] = raw_text_path
+        # 原始文字已不再需要，在序列化 records 前先釋放
+        del raw_text
+        
+        # 輸出單一PDF的結果
+        _dump_result_json(result, output_path)
+        
+        print(f"已輸出結果至: {output_path}")
+        
+        # 只回傳摘要，避免在行程間傳遞完整的文字內容
+        return {
+            "filename": result["filename"],
+            "record_count": result.get("metadata", {}).get("record_count", 0),
+            "has_error": "error" in result
+        }
+    
     def process_all_pdfs(self):
         """處理所有PDF檔案並輸出結果"""
         pdf_files = self.find_all_pdfs()
-        all_results = []
         
-        for pdf_path in pdf_files:
-            result = self.extract_single_pdf(pdf_path)
-            all_results.append(result)
-            
-            # 生成單一PDF的輸出檔案名
-            output_basename = os.path.splitext(os.path.basename(pdf_path))[0]
-            output_path = os.path.join(self.output_dir, f"{output_basename}.json")
-            
-            # 輸出單一PDF的結果
-            with open(output_path, 'w', encoding='utf-8') as f:
-                json.dump(result, f, ensure_ascii=False, indent=2)
-            
-            print(f"已輸出結果至: {output_path}")
+        # 同一批次的所有檔案共用同一個提取時間
+        batch_time = datetime.now().isoformat()
+        
+        # 每個PDF彼此獨立，以多行程平行解析；map 會保持輸入順序
+        pdf_summaries = []
+        total_records = 0
+        with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+            for pdf_summary in executor.map(
+                    partial(self.extract_and_dump, extraction_date=batch_time), pdf_files):
+                total_records += pdf_summary["record_count"]
+                pdf_summaries.append(pdf_summary)
         
         # 輸出所有結果的摘要
         summary = {
             "total_pdfs": len(pdf_files),
-            "extraction_date": datetime.now().isoformat(),
-            "pdf_summaries": []
+            "extraction_date": batch_time,
+            "pdf_summaries": pdf_summaries
         }
         
-        for result in all_results:
-            summary["pdf_summaries"].append({
-                "filename": result["filename"],
-                "record_count": result.get("metadata", {}).get("record_count", 0),
-                "has_error": "error" in result
-            })
-        
         summary_path = os.path.join(self.output_dir, "extraction_summary.json")
-        with open(summary_path, 'w', encoding='utf-8') as f:
-            json.dump(summary, f, ensure_ascii=False, indent=2)
+        _dump_json(summary, summary_path)
         
         print(f"\n摘要報告已輸出至: {summary_path}")
-        print(f"共處理了 {len(pdf_files)} 個PDF檔案，提取了 {sum(s['record_count'] for s in summary['pdf_summaries'])} 筆記錄")
+        print(f"共處理了 {len(pdf_files)} 個PDF檔案，提取了 {total_records} 筆記錄")
 
 def main():
     parser = argparse.ArgumentParser(description='酒駕資料PDF解析器')
     parser.add_argument('--pdf_dir', default='data/processed', help='PDF檔案所在目錄')
     parser.add_argument('--output_dir', default='data/extracted', help='輸出目錄')
+    parser.add_argument('--workers', type=int, default=None, help='平行處理的行程數（預設為CPU核心數）')
+    parser.add_argument('--include_raw_text', action='store_true', help='另外以 .txt.gz 保存PDF原始文字內容')
     args = parser.parse_args()
     
-    extractor = DuiPdfExtractor(args.pdf_dir, args.output_dir)
+    extractor = DuiPdfExtractor(args.pdf_dir, args.output_dir, args.workers, args.include_raw_text)
     extractor.process_all_pdfs()
 
 if __name__ == "__main__":
@@ -1,27 +1,29 @@
-import PyPDF2
+try:
+    import pymupdf
+except ImportError:  # PyMuPDF 1.24.3 之前只提供 fitz 模組名稱
+    import fitz as pymupdf
+from extract_pdf_data import extract_page_text
 import re
 from pprint import pprint
 
 # 開啟PDF檔案
-with open('taichung_dui_list.pdf', 'rb') as pdf_file:
-    pdf_reader = PyPDF2.PdfReader(pdf_file)
-    
+with pymupdf.open('taichung_dui_list.pdf') as doc:
     # 取得頁數
-    num_pages = len(pdf_reader.pages)
+    num_pages = doc.page_count
     print(f"PDF 共有 {num_pages} 頁")
     
     # 讀取前2頁的內容
     for page_num in range(min(2, num_pages)):
-        page = pdf_reader.pages[page_num]
-        text = page.extract_text()
+        page = doc[page_num]
+        text = extract_page_text(page)
         
         print(f"\n===== 第 {page_num+1} 頁內容 =====")
         print(text[:1000])  # 只顯示前1000個字元
         
     # 嘗試解析資料結構（假設是表格形式）
     # 這只是一個簡單的解析示例，實際情況可能需要根據PDF的具體結構調整
-    sample_page = pdf_reader.pages[0]
-    sample_text = sample_page.extract_text()
+    sample_page = doc[0]
+    sample_text = extract_page_text(sample_page)
     
     print("\n\n===== 嘗試解析資料結構 =====")
     